@@ -0,0 +1,28 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Reintentos con backoff exponencial (0s, 2s, 4s con urllib3 2.x) ante errores de conexión y
+# respuestas transitorias, p. ej. mientras Render arranca el servicio en frío.
+# Respeta Retry-After y, agotados los intentos, devuelve la última respuesta.
+RETRY = Retry(
+    total=3,
+    backoff_factor=1.0,
+    status_forcelist=(429, 502, 503, 504),
+    allowed_methods=frozenset(["POST"]),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+# Timeouts separados (conexión, lectura): un handshake TCP/TLS atascado se corta a
+# los 3.05 s (algo más que el reintento de SYN de TCP) y se reintenta, sin consumir
+# el margen de lectura que necesita un servicio que acaba de arrancar
+TIMEOUT = (3.05, 27)
+
+# Sesión HTTP compartida por los scripts de prueba del webhook: reutiliza la
+# conexión keep-alive (y el handshake TLS) entre peticiones al servidor de Render.
+# El mismo adaptador sirve también http://, p. ej. un servidor local en localhost:8000
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=2, pool_maxsize=10, max_retries=RETRY)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
@@ -0,0 +1,153 @@
+import requests
+import logging
+import orjson
+import os
+import sys
+import time
+import uuid
+from typing import Dict, Optional
+from _http import TIMEOUT, session
+# env_config carga el archivo .env (si existe) al importarse
+from env_config import WEBHOOK_SECRET
+
+# Lógica común de test_webhook.py y test_webhook_with_numbers.py: ambos envían
+# un card.move al servidor de Render y solo difieren en el payload y los mensajes.
+
+# Con --json solo se escribe un resumen JSON en una línea (para CI); sin él, el informe legible
+JSON_OUTPUT = "--json" in sys.argv
+
+# Cada bloque del informe se escribe como un solo registro en stdout
+logging.basicConfig(level=logging.WARNING if JSON_OUTPUT else logging.INFO, format="%(message)s", stream=sys.stdout)
+logger = logging.getLogger("webhook_test")
+
+# URL del servidor en Render (configurable con PIPEFY_WEBHOOK_URL)
+RENDER_URL = os.getenv("PIPEFY_WEBHOOK_URL", "https://pipefy-agentic-processor.onrender.com/webhook/pipefy")
+
+# Token de autorización: PIPEFY_WEBHOOK_TOKEN o, si no está, el mismo secreto que usa el servidor
+AUTH_TOKEN = os.getenv("PIPEFY_WEBHOOK_TOKEN") or WEBHOOK_SECRET or ""
+
+# Cabeceras de la solicitud, calculadas una vez y fijadas en la sesión
+HEADERS = {
+    "Authorization": f"Bearer {AUTH_TOKEN}",
+    "Content-Type": "application/json"
+}
+session.headers.update(HEADERS)
+
+# En el informe el token solo se muestra enmascarado (últimos 4 caracteres)
+MASKED_TOKEN = f"configurado (…{AUTH_TOKEN[-4:]})" if len(AUTH_TOKEN) > 8 else ("configurado" if AUTH_TOKEN else "no configurado")
+
+# Las cabeceras de respuesta solo se muestran con WEBHOOK_TEST_VERBOSE o si la respuesta no es 2xx
+VERBOSE = bool(os.getenv("WEBHOOK_TEST_VERBOSE"))
+
+# Mensajes para los códigos de error conocidos
+ERROR_MESSAGES = {
+    401: "Error de autenticación. Verifica que el token de autorización sea correcto",
+    404: "Endpoint no encontrado. Verifica la URL del webhook",
+}
+
+def warm_up() -> None:
+    """
+    Despierta el servicio de Render (que se duerme tras un rato inactivo) y abre la
+    conexión TLS con un HEAD previo, para que la latencia medida del POST no incluya
+    el arranque en frío. Cualquier respuesta sirve, incluido un 405.
+    """
+    start = time.perf_counter()
+    try:
+        session.head(RENDER_URL, timeout=(3.05, 30))
+    except requests.RequestException as e:
+        logger.info("  Calentamiento fallido (%s); se continúa con el test", e)
+        return
+    logger.info("  Calentamiento del servidor: %.0f ms", (time.perf_counter() - start) * 1000)
+
+def run_webhook_test(
+    title: str,
+    payload: dict,
+    payload_kind: str,
+    card_label: str,
+    success_message: str,
+    extra_error_messages: Optional[Dict[int, str]] = None,
+) -> None:
+    """Envía el payload al webhook e imprime la respuesta y su evaluación (o el resumen JSON con --json)."""
+    logger.info("=== %s ===\nUsando URL: %s", title, RENDER_URL)
+    if not AUTH_TOKEN:
+        logger.info("  ⚠️ PIPEFY_WEBHOOK_TOKEN no configurado; la solicitud irá sin token válido")
+
+    # Mismo ID en todos los reintentos: el servidor deduplica por webhook_id
+    payload = {**payload, "webhook_id": str(uuid.uuid4())}
+    # Cuerpo serializado una sola vez; Content-Type ya va en las cabeceras de la sesión
+    body = orjson.dumps(payload)
+    error_messages = {**ERROR_MESSAGES, **(extra_error_messages or {})}
+    result = {"url": RENDER_URL, "payload_kind": payload_kind, "status": None, "latency_ms": None, "ok": False, "body_snippet": None}
+
+    logger.info(
+        "\n1. Enviando solicitud al webhook con:\n"
+        "  - URL: %s\n"
+        "  - Token de autorización: %s\n"
+        "  - Tipo de evento: %s\n"
+        "  - ID de webhook: %s\n"
+        "  - %s: %s",
+        RENDER_URL, MASKED_TOKEN, payload['data']['action'], payload['webhook_id'],
+        card_label, payload['data']['card']['id'],
+    )
+
+    try:
+        # Realizar la solicitud POST
+        logger.info("\n2. Respuesta del servidor:")
+        warm_up()
+        logger.info("  Envío de solicitud...")
+
+        start = time.perf_counter()
+        response = session.post(RENDER_URL, data=body, timeout=TIMEOUT)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        ok = 200 <= response.status_code < 300
+        result.update(status=response.status_code, latency_ms=round(latency_ms, 1), ok=ok, body_snippet=response.text[:500])
+        # Todo el bloque de respuesta se acumula y se escribe de una vez; con --json
+        # (nivel WARNING) no se llega a formatear
+        if logger.isEnabledFor(logging.INFO):
+            lines = [
+                "  - Código de estado: %s" % response.status_code,
+                "  - Latencia: %.0f ms" % latency_ms,
+            ]
+            if VERBOSE or not ok:
+                # Se recorren los items: el repr de CaseInsensitiveDict copiaría todo a un dict
+                lines.append("  - Cabeceras de respuesta: %s" % ", ".join(f"{k}: {v}" for k, v in response.headers.items()))
+            # Solo se parsea como JSON si el servidor lo declara así (una página de error
+            # HTML de Render, p. ej. un 502, va directamente como texto)
+            response_json = None
+            if response.headers.get("Content-Type", "").startswith("application/json"):
+                try:
+                    response_json = orjson.loads(response.content)
+                except orjson.JSONDecodeError:
+                    # JSON declarado pero vacío o mal formado: se muestra como texto
+                    pass
+            if response_json is not None:
+                lines.append("  - Respuesta JSON: %s" % orjson.dumps(response_json, option=orjson.OPT_INDENT_2).decode())
+            else:
+                lines.append("  - Cuerpo de respuesta: %s" % response.text[:500])
+                if len(response.text) > 500:
+                    lines.append("    (respuesta truncada a 500 caracteres)")
+
+            # Evaluación de la respuesta
+            lines.append("\n3. Evaluación:")
+            if ok:
+                lines.append("  ✅ El servidor respondió con éxito (código 2xx)")
+                lines.append("  ✅ %s" % success_message)
+            else:
+                lines.append("  ❌ El servidor respondió con error")
+                lines.append("  ❌ %s" % error_messages.get(response.status_code, f"Error desconocido (código {response.status_code})"))
+            logger.info("%s", "\n".join(lines))
+
+    except requests.exceptions.ConnectionError as e:
+        result["error"] = str(e)
+        logger.info("  ❌ No se pudo conectar al servidor. Verifica que la URL sea correcta y el servidor esté en línea")
+    except requests.exceptions.Timeout as e:
+        result["error"] = str(e)
+        logger.info("  ❌ Tiempo de espera agotado. El servidor está tardando demasiado en responder")
+    except Exception as e:
+        result["error"] = str(e)
+        logger.info("  ❌ Error inesperado: %s", e)
+
+    logger.info("\n=== FIN DEL TEST ===")
+    if JSON_OUTPUT:
+        sys.stdout.buffer.write(orjson.dumps(result) + b"\n")
@@ -1,61 +1,80 @@
-import os
-from dotenv import load_dotenv
-
-# Cargar variables de entorno si existe un archivo .env
-load_dotenv()
-
-print("=== VERIFICACIÓN DE SEGURIDAD DEL WEBHOOK DE PIPEFY ===")
-
-# Comprobar configuración de variables de entorno en el sistema
-pipefy_token = os.getenv("PIPEFY_TOKEN")
-render_service_secret = os.getenv("RENDER_SERVICE_SECRET")
-pipefy_webhook_secret = os.getenv("PIPEFY_WEBHOOK_SECRET")
-vision_agent_api_key = os.getenv("VISION_AGENT_API_KEY")
-attachment_field_id = os.getenv("PIPEFY_ATTACHMENT_FIELD_ID")
-
-print("\n1. Verificando variables de entorno:")
-print(f"  - PIPEFY_TOKEN: {'Configurado ✅' if pipefy_token else 'No configurado ❌'}")
-print(f"  - RENDER_SERVICE_SECRET: {'Configurado ✅' if render_service_secret else 'No configurado ❌'}")
-print(f"  - PIPEFY_WEBHOOK_SECRET: {'Configurado ✅' if pipefy_webhook_secret else 'No configurado ❌'}")
-print(f"  - VISION_AGENT_API_KEY: {'Configurado ✅' if vision_agent_api_key else 'No configurado ❌'}")
-print(f"  - PIPEFY_ATTACHMENT_FIELD_ID: {'Configurado ✅' if attachment_field_id and attachment_field_id != 'id_del_campo_adjunto' else 'No configurado o valor por defecto ❌'}")
-
-print("\n2. Verificando congruencia entre variables:")
-webhook_secret = render_service_secret or pipefy_webhook_secret
-if webhook_secret:
-    print(f"  - Valor de secreto para autenticación de webhook: {webhook_secret}")
-    
-    if webhook_secret == "Pipefy17570000":
-        print("  - ✅ El secreto coincide con el valor esperado (Pipefy17570000)")
-    else:
-        print("  - ❌ El secreto NO coincide con el valor esperado (Pipefy17570000)")
-else:
-    print("  - ❌ No hay secreto configurado para la autenticación del webhook")
+import sys
+from string import Template
+# env_config carga el archivo .env (si existe) al importarse
+from env_config import (
+    ATTACHMENT_FIELD_ID,
+    DEFAULT_ATTACHMENT_FIELD_ID,
+    PIPEFY_TOKEN,
+    PIPEFY_WEBHOOK_SECRET,
+    RENDER_SERVICE_SECRET,
+    VISION_AGENT_API_KEY,
+    WEBHOOK_SECRET,
+)
 
-print("\n3. Recomendaciones:")
-if not pipefy_token:
-    print("  - ❌ Configure PIPEFY_TOKEN para poder acceder a la API de Pipefy")
+EXPECTED_SECRET = "Pipefy17570000"
 
-if not webhook_secret:
-    print("  - ❌ Configure RENDER_SERVICE_SECRET o PIPEFY_WEBHOOK_SECRET con el valor 'Pipefy17570000'")
-elif webhook_secret != "Pipefy17570000":
-    print(f"  - ❌ Actualice el valor de {'RENDER_SERVICE_SECRET' if render_service_secret else 'PIPEFY_WEBHOOK_SECRET'} a 'Pipefy17570000'")
+# Informe completo; se rellena con una sola sustitución y se escribe de una vez
+REPORT = Template("""=== VERIFICACIÓN DE SEGURIDAD DEL WEBHOOK DE PIPEFY ===
+
+1. Verificando variables de entorno:
+  - PIPEFY_TOKEN: $pipefy_token
+  - RENDER_SERVICE_SECRET: $render_service_secret
+  - PIPEFY_WEBHOOK_SECRET: $pipefy_webhook_secret
+  - VISION_AGENT_API_KEY: $vision_agent_api_key
+  - PIPEFY_ATTACHMENT_FIELD_ID: $attachment_field_id
+
+2. Verificando congruencia entre variables:
+$congruence
+
+3. Recomendaciones:
+$recommendations
+4. Estado del servidor de webhook:
+  - URL del webhook: /webhook/pipefy
+  - Método: POST
+  - Cabecera de autenticación esperada: Authorization: Bearer Pipefy17570000
 
-if not vision_agent_api_key:
-    print("  - ❌ Configure VISION_AGENT_API_KEY para usar agentic-doc")
+5. Configuración en Pipefy:
+Asegúrese de que el webhook en Pipefy:
+  - Apunte a la URL correcta del servidor de Render
+  - Tenga configurada la cabecera 'Authorization: Bearer Pipefy17570000'
+  - Esté configurado para escuchar los eventos relevantes (card.move, etc.)
 
-if not attachment_field_id or attachment_field_id == "id_del_campo_adjunto":
-    print("  - ❌ Configure PIPEFY_ATTACHMENT_FIELD_ID con el ID correcto del campo de adjuntos")
+=== FIN DE LA VERIFICACIÓN ===
+""")
 
-print("\n4. Estado del servidor de webhook:")
-print("  - URL del webhook: /webhook/pipefy")
-print("  - Método: POST")
-print("  - Cabecera de autenticación esperada: Authorization: Bearer Pipefy17570000")
+def mark(configured, missing_text: str = "No configurado ❌") -> str:
+    return "Configurado ✅" if configured else missing_text
 
-print("\n5. Configuración en Pipefy:")
-print("Asegúrese de que el webhook en Pipefy:")
-print("  - Apunte a la URL correcta del servidor de Render")
-print("  - Tenga configurada la cabecera 'Authorization: Bearer Pipefy17570000'")
-print("  - Esté configurado para escuchar los eventos relevantes (card.move, etc.)")
+attachment_field_ok = bool(ATTACHMENT_FIELD_ID) and ATTACHMENT_FIELD_ID != DEFAULT_ATTACHMENT_FIELD_ID
+webhook_secret = WEBHOOK_SECRET
+
+if webhook_secret:
+    congruence = f"  - Valor de secreto para autenticación de webhook: {webhook_secret}\n"
+    if webhook_secret == EXPECTED_SECRET:
+        congruence += f"  - ✅ El secreto coincide con el valor esperado ({EXPECTED_SECRET})"
+    else:
+        congruence += f"  - ❌ El secreto NO coincide con el valor esperado ({EXPECTED_SECRET})"
+else:
+    congruence = "  - ❌ No hay secreto configurado para la autenticación del webhook"
+
+recommendations = []
+if not PIPEFY_TOKEN:
+    recommendations.append("  - ❌ Configure PIPEFY_TOKEN para poder acceder a la API de Pipefy")
+if not webhook_secret:
+    recommendations.append(f"  - ❌ Configure RENDER_SERVICE_SECRET o PIPEFY_WEBHOOK_SECRET con el valor '{EXPECTED_SECRET}'")
+elif webhook_secret != EXPECTED_SECRET:
+    recommendations.append(f"  - ❌ Actualice el valor de {'RENDER_SERVICE_SECRET' if RENDER_SERVICE_SECRET else 'PIPEFY_WEBHOOK_SECRET'} a '{EXPECTED_SECRET}'")
+if not VISION_AGENT_API_KEY:
+    recommendations.append("  - ❌ Configure VISION_AGENT_API_KEY para usar agentic-doc")
+if not attachment_field_ok:
+    recommendations.append("  - ❌ Configure PIPEFY_ATTACHMENT_FIELD_ID con el ID correcto del campo de adjuntos")
 
-print("\n=== FIN DE LA VERIFICACIÓN ===") 
\ No newline at end of file
+sys.stdout.write(REPORT.substitute(
+    pipefy_token=mark(PIPEFY_TOKEN),
+    render_service_secret=mark(RENDER_SERVICE_SECRET),
+    pipefy_webhook_secret=mark(PIPEFY_WEBHOOK_SECRET),
+    vision_agent_api_key=mark(VISION_AGENT_API_KEY),
+    attachment_field_id=mark(attachment_field_ok, "No configurado o valor por defecto ❌"),
+    congruence=congruence,
+    recommendations="".join(f"{line}\n" for line in recommendations),
+))
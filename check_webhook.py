@@ -1,12 +1,12 @@
-import requests
+import sys
 import json
-import os
+import httpx
+import env_config
+
+HELP_TEXT = """Para verificar tus webhooks actuales en Pipefy, sigue estos pasos:
+1. Ve a https://app.pipefy.com/graphiql
+2. Ejecuta esta consulta (reemplaza EFRxKPhq con tu Pipe ID si es diferente):
 
-# Consultar el token en GraphiQL
-print("Para verificar tus webhooks actuales en Pipefy, sigue estos pasos:")
-print("1. Ve a https://app.pipefy.com/graphiql")
-print("2. Ejecuta esta consulta (reemplaza EFRxKPhq con tu Pipe ID si es diferente):")
-print("""
 query GetWebhooks {
   pipe(id: "EFRxKPhq") {
     webhooks {
@@ -19,10 +19,10 @@ query GetWebhooks {
     }
   }
 }
-""")
-print("\nLuego, verifica si los webhooks tienen configurado el encabezado 'headers'.")
-print("Si no tienen headers o no incluyen 'Authorization', debes actualizar el webhook con esta mutación:")
-print("""
+
+Luego, verifica si los webhooks tienen configurado el encabezado 'headers'.
+Si no tienen headers o no incluyen 'Authorization', debes actualizar el webhook con esta mutación:
+
 mutation UpdateWebhook {
   updateWebhook(input: {
     id: "ID_DEL_WEBHOOK"  # Reemplaza con el ID del webhook que quieres actualizar
@@ -35,17 +35,22 @@ mutation UpdateWebhook {
     }
   }
 }
-""")
 
-print("\nAdemás, asegúrate de que estas variables de entorno estén configuradas en Render:")
-print("1. PIPEFY_TOKEN - Para acceder a la API de Pipefy")
-print("2. RENDER_SERVICE_SECRET (o PIPEFY_WEBHOOK_SECRET) - Para autenticar las llamadas webhook (Configurado como: Pipefy17570000)")
-print("3. VISION_AGENT_API_KEY - Para usar agentic-doc")
-print("4. PIPEFY_ATTACHMENT_FIELD_ID - El ID del campo donde están los documentos adjuntos")
-print("\nTodos estos valores deben coincidir entre Pipefy y Render para que el webhook funcione correctamente.")
+Además, asegúrate de que estas variables de entorno estén configuradas en Render:
+1. PIPEFY_TOKEN - Para acceder a la API de Pipefy
+2. RENDER_SERVICE_SECRET (o PIPEFY_WEBHOOK_SECRET) - Para autenticar las llamadas webhook (Configurado como: Pipefy17570000)
+3. VISION_AGENT_API_KEY - Para usar agentic-doc
+4. PIPEFY_ATTACHMENT_FIELD_ID - El ID del campo donde están los documentos adjuntos
+
+Todos estos valores deben coincidir entre Pipefy y Render para que el webhook funcione correctamente."""
+
+# Las instrucciones solo se muestran con --help; sin él, el script hace únicamente la consulta
+if "--help" in sys.argv:
+    print(HELP_TEXT)
+    sys.exit(0)
 
 # Reemplaza estos valores con los tuyos
-PIPEFY_TOKEN = os.getenv("PIPEFY_TOKEN", "REEMPLAZA_CON_TU_TOKEN")  # Tu token de API de Pipefy
+PIPEFY_TOKEN = env_config.PIPEFY_TOKEN or "REEMPLAZA_CON_TU_TOKEN"  # Tu token de API de Pipefy
 PIPE_ID = "EFRxKPhq"  # ID del pipe donde está configurado el webhook
 
 # Consulta GraphQL para obtener los webhooks
@@ -71,11 +76,12 @@ headers = {
 }
 
 # Realizar la solicitud
-response = requests.post(
-    "https://api.pipefy.com/graphql",
-    json={"query": query},
-    headers=headers
-)
+with httpx.Client(http2=True, timeout=10) as client:
+    response = client.post(
+        "https://api.pipefy.com/graphql",
+        json={"query": query},
+        headers=headers
+    )
 
 # Procesar la respuesta
 if response.status_code == 200:
@@ -129,18 +135,4 @@ else:
     print(f"Error en la solicitud HTTP: {response.status_code}")
     print(response.text)
 
-print("\nSi necesitas actualizar el webhook con los headers correctos, usa esta mutación:")
-print("""
-mutation UpdateWebhook {
-  updateWebhook(input: {
-    id: "ID_DEL_WEBHOOK"  # Reemplaza con el ID del webhook que quieres actualizar
-    headers: "{\\\"Authorization\\\": \\\"Bearer Pipefy17570000\\\"}"  # Este es el token configurado en RENDER_SERVICE_SECRET
-  }) {
-    webhook {
-      id
-      name
-      headers
-    }
-  }
-}
-""") 
\ No newline at end of file
+print("\nSi necesitas actualizar el webhook con los headers correctos, ejecuta este script con --help para ver la mutación.")
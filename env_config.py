@@ -0,0 +1,28 @@
+import os
+from typing import Optional
+from dotenv import load_dotenv
+
+# Configuración compartida por main.py y los scripts de verificación.
+# El archivo .env se lee una sola vez por proceso.
+_LOADED = False
+
+def _init() -> None:
+    """Carga el archivo .env si todavía no se ha cargado."""
+    global _LOADED
+    if _LOADED:
+        return
+    load_dotenv()
+    _LOADED = True
+
+_init()
+
+# Valor por defecto que indica que el ID del campo de adjuntos no se ha configurado
+DEFAULT_ATTACHMENT_FIELD_ID = "id_del_campo_adjunto"
+
+PIPEFY_TOKEN: Optional[str] = os.getenv("PIPEFY_TOKEN")
+VISION_AGENT_API_KEY: Optional[str] = os.getenv("VISION_AGENT_API_KEY")
+RENDER_SERVICE_SECRET: Optional[str] = os.getenv("RENDER_SERVICE_SECRET")
+PIPEFY_WEBHOOK_SECRET: Optional[str] = os.getenv("PIPEFY_WEBHOOK_SECRET")
+# Secreto efectivo del webhook: RENDER_SERVICE_SECRET tiene prioridad sobre PIPEFY_WEBHOOK_SECRET
+WEBHOOK_SECRET: Optional[str] = RENDER_SERVICE_SECRET or PIPEFY_WEBHOOK_SECRET
+ATTACHMENT_FIELD_ID: str = os.getenv("PIPEFY_ATTACHMENT_FIELD_ID", DEFAULT_ATTACHMENT_FIELD_ID)
@@ -1,176 +1,498 @@
 import os
-import requests
+import re
+import asyncio
 import logging
-from fastapi import FastAPI, Request, HTTPException, Header
-from pydantic import BaseModel, Field, HttpUrl, ValidationError
+import atexit
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from fastapi import BackgroundTasks, FastAPI, Request, HTTPException, Header
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl, ValidationError, field_validator
 from typing import List, Optional, Dict, Any, Union
 from agentic_doc.parse import parse_documents
-from dotenv import load_dotenv
+from env_config import (
+    ATTACHMENT_FIELD_ID,
+    DEFAULT_ATTACHMENT_FIELD_ID,
+    PIPEFY_TOKEN,
+    VISION_AGENT_API_KEY,
+    WEBHOOK_SECRET,
+)
 import uuid
+import shutil
+from urllib.parse import urlsplit
 import httpx
+import aiofiles
+import aiofiles.os
+from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 import sys
-import json
+import orjson
 import hashlib
-from datetime import datetime, timedelta
+import secrets
+from datetime import datetime
 import time
+import threading
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+
+try:
+    import blake3
+except ImportError:  # El hash de caché recurre a hashlib
+    blake3 = None
 
 # Configuración
-load_dotenv()
-PIPEFY_TOKEN = os.getenv("PIPEFY_TOKEN")
-VISION_AGENT_API_KEY = os.getenv("VISION_AGENT_API_KEY")
-PIPEFY_WEBHOOK_SECRET = os.getenv("RENDER_SERVICE_SECRET") or os.getenv("PIPEFY_WEBHOOK_SECRET")
 OUTPUT_DIR = os.getenv("OUTPUT_DIR", "/data")
-PIPEFY_GRAPHQL_ENDPOINT = "https://api.pipefy.com/graphql"
-ATTACHMENT_FIELD_ID = os.getenv("PIPEFY_ATTACHMENT_FIELD_ID", "id_del_campo_adjunto")
+PIPEFY_API_BASE_URL = "https://api.pipefy.com"
+PIPEFY_GRAPHQL_PATH = "/graphql"
+
+# Valores derivados de la configuración, calculados una sola vez al importar
+_PIPEFY_AUTH_HEADER = {
+    "Authorization": f"Bearer {PIPEFY_TOKEN}",
+    "Content-Type": "application/json",
+}
+_ATTACHMENT_CONFIGURED = bool(ATTACHMENT_FIELD_ID) and ATTACHMENT_FIELD_ID != DEFAULT_ATTACHMENT_FIELD_ID
+# Cabecera esperada en los webhooks (None si no hay secreto configurado)
+_EXPECTED_AUTH = f"Bearer {WEBHOOK_SECRET}".encode() if WEBHOOK_SECRET else None
+
+# Fragmento GraphQL con los adjuntos y campos que se consultan de cada tarjeta
+_CARD_ATTACHMENTS_FRAGMENT = """
+fragment CardAttachments on Card {
+  attachments {
+    path
+    url
+  }
+  fields {
+    name
+    field {
+      id
+    }
+    value
+    array_value
+  }
+}
+"""
+
+# Consulta GraphQL de la URL de descarga directa (getPresignedUrl); el ID del adjunto va en variables
+_PRESIGNED_URL_QUERY = """
+query GetPresignedUrl($aid: ID!) {
+  getPresignedUrl(input: { attachableId: $aid }) {
+    signedUrl
+  }
+}
+"""
+
+# Número máximo de documentos procesados a la vez por agentic-doc; limita además
+# las llamadas simultáneas a la API de Vision Agent
+PARSE_CONCURRENCY = int(os.getenv("PARSE_CONCURRENCY", "4"))
+PARSER_POOL: Optional[ThreadPoolExecutor] = None
+
+# Ventana (en segundos) y tamaño máximo de agrupación de consultas de tarjetas
+CARD_BATCH_WINDOW = float(os.getenv("CARD_BATCH_WINDOW", "0.015"))
+CARD_BATCH_MAX_SIZE = int(os.getenv("CARD_BATCH_MAX_SIZE", "50"))
+
+# Extensión del archivo al final de la ruta de la URL (antes de la query o el fragmento)
+_EXT_RE = re.compile(r'\.([A-Za-z0-9]{1,5})(?:\?|#|$)')
 
 # Configuración de logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Los handlers solo encolan el registro; la escritura real a la consola la hace
+# el hilo de QueueListener, así los logs no bloquean el event loop
+_log_queue = queue.SimpleQueue()
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+_log_listener = QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+# QueueHandler ya entrega el mensaje formateado; fecha y nivel los añade _log_handler
+logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[QueueHandler(_log_queue)])
 logger = logging.getLogger(__name__)
 
-# Caché para evitar procesamiento múltiple
-# Estructura: {hash_archivo: {"timestamp": datetime, "result_path": str}}
-DOCUMENT_CACHE = {}
+# Crear el directorio de salida una sola vez al arrancar
+try:
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+except OSError as e:
+    logger.error("No se pudo crear el directorio de salida %s: %s", OUTPUT_DIR, e)
+
 # Tiempo de expiración del caché en horas
 CACHE_EXPIRY_HOURS = 24
-
-# Caché para deduplicación de webhooks
-# Estructura: {webhook_id: {"timestamp": datetime, "card_id": str}}
-WEBHOOK_CACHE = {}
 # Tiempo de expiración de la deduplicación de webhooks (en segundos)
-WEBHOOK_DEDUP_EXPIRY = 60  # 1 minuto 
+WEBHOOK_DEDUP_EXPIRY = int(os.getenv("WEBHOOK_DEDUP_EXPIRY", "60"))  # 1 minuto por defecto
+# Minutos tras los que un webhook que sigue en 'processing' (p. ej. porque el
+# proceso murió a mitad o Pipefy falló) se vuelve a encolar
+WEBHOOK_REQUEUE_AFTER_MINUTES = int(os.getenv("WEBHOOK_REQUEUE_AFTER_MINUTES", "10"))
+# Número máximo de veces que se reencola un mismo webhook antes de darlo por perdido
+WEBHOOK_MAX_REQUEUES = int(os.getenv("WEBHOOK_MAX_REQUEUES", "5"))
+
+# Caché persistente para evitar procesamiento múltiple: sobrevive a reinicios,
+# así un documento ya procesado no vuelve a pasar por agentic-doc.
+# Tablas doc_cache(hash, result_path, ts), url_cache(url, hash, ts), etag_cache(etag, hash, ts)
+# y webhook_seen(webhook_id, card_id, ts, status, attempts), en una base SQLite en el subdirectorio
+# .cache del directorio de salida, para que no aparezca entre los resultados de /archivos.
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(OUTPUT_DIR, ".cache", "hash_cache.db"))
+# Cada cuánto se borran las entradas expiradas y se reencolan los webhooks atascados (en segundos)
+CACHE_SWEEP_INTERVAL = min(3600, max(60, WEBHOOK_REQUEUE_AFTER_MINUTES * 60))
+# None si la base no se pudo abrir: el servicio funciona igual, sin caché ni deduplicación
+cache_db: Optional[sqlite3.Connection] = None
+
+# Documentos que se están procesando ahora mismo: {hash: Future con la ruta del resultado}.
+# Solo se usa desde el event loop, por lo que no necesita lock.
+_PARSES_IN_FLIGHT: Dict[str, asyncio.Future] = {}
+
+# Webhooks que este proceso está procesando ahora mismo; la limpieza periódica no los
+# reencola aunque lleven más de WEBHOOK_REQUEUE_AFTER_MINUTES (p. ej. un parse largo)
+_WEBHOOKS_IN_PROGRESS: set = set()
+
+# Contadores de deduplicación de webhooks, expuestos en /health
+WEBHOOK_METRICS = {"seen_count": 0, "duplicate_count": 0}
+
+# Protege la conexión SQLite compartida (no es thread-safe) y los contadores
+cache_lock = threading.Lock()
+
+# Tamaño de lectura al calcular el hash de un archivo sin BLAKE3 ni hashlib.file_digest
+HASH_CHUNK_SIZE = 1024 * 1024
 
 # Sistema de caché para documentos
 def get_file_hash(filepath: str) -> str:
-    """Calcula el hash MD5 de un archivo para usarlo como clave de caché."""
+    """
+    Calcula el hash de un archivo para usarlo como clave de caché.
+    Usa BLAKE3 (mmap + SIMD, multihilo) si está instalado; si no, MD5 con el bucle de lectura en C.
+    """
     try:
-        hash_md5 = hashlib.md5()
+        if blake3 is not None:
+            return blake3.blake3(max_threads=blake3.blake3.AUTO).update_mmap(filepath).hexdigest()
         with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
+            if hasattr(hashlib, "file_digest"):  # Python 3.11+
+                return hashlib.file_digest(f, "md5").hexdigest()
+            hash_md5 = hashlib.md5()
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
                 hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+            return hash_md5.hexdigest()
     except Exception as e:
-        logger.error(f"Error calculando hash para {filepath}: {e}")
+        logger.error("Error calculando hash para %s: %s", filepath, e)
         # En caso de error, devolvemos un hash único basado en nombre y timestamp
         return hashlib.md5(f"{filepath}_{datetime.now().isoformat()}".encode()).hexdigest()
 
-def is_cached_document(filepath: str) -> tuple[bool, Optional[str]]:
+def init_cache_db() -> sqlite3.Connection:
+    """Abre (o crea) la base SQLite del caché de documentos y de webhooks vistos."""
+    os.makedirs(os.path.dirname(CACHE_DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS doc_cache(hash TEXT PRIMARY KEY, result_path TEXT, ts REAL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS doc_cache_ts ON doc_cache(ts)")
+    # Índice secundario URL del adjunto (ver url_cache_key) -> hash, para no volver a descargar
+    conn.execute("CREATE TABLE IF NOT EXISTS url_cache(url TEXT PRIMARY KEY, hash TEXT, ts REAL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS url_cache_ts ON url_cache(ts)")
+    # Índice secundario host+ETag de la descarga -> hash, para cortar la descarga tras las cabeceras
+    conn.execute("CREATE TABLE IF NOT EXISTS etag_cache(etag TEXT PRIMARY KEY, hash TEXT, ts REAL)")
+    conn.execute("CREATE INDEX IF NOT EXISTS etag_cache_ts ON etag_cache(ts)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS webhook_seen("
+        "webhook_id TEXT PRIMARY KEY, card_id TEXT, ts REAL, status TEXT NOT NULL DEFAULT 'processing', "
+        "attempts INTEGER NOT NULL DEFAULT 0)"
+    )
+    # Bases creadas antes de existir las columnas status y attempts
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(webhook_seen)")}
+    if "status" not in columns:
+        conn.execute("ALTER TABLE webhook_seen ADD COLUMN status TEXT NOT NULL DEFAULT 'done'")
+    if "attempts" not in columns:
+        conn.execute("ALTER TABLE webhook_seen ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS webhook_seen_ts ON webhook_seen(ts)")
+    conn.commit()
+    return conn
+
+def is_cached_document(filepath: str) -> tuple[bool, Optional[str], Optional[str]]:
     """
     Verifica si un documento ya está en caché.
-    Retorna (está_en_caché, ruta_resultado_anterior)
+    Lee el archivo completo para calcular su hash: llamar con asyncio.to_thread.
+    Retorna (está_en_caché, ruta_resultado_anterior, hash_archivo)
     """
+    file_hash = None
     try:
         file_hash = get_file_hash(filepath)
+        if cache_db is None:
+            return False, None, file_hash
+
+        with cache_lock:
+            row = cache_db.execute(
+                "SELECT result_path FROM doc_cache WHERE hash = ? AND ts > ?",
+                (file_hash, time.time() - CACHE_EXPIRY_HOURS * 3600),
+            ).fetchone()
+        if row is not None:
+            logger.info("Documento encontrado en caché: %s -> %s", filepath, file_hash)
+            return True, row[0], file_hash
         
-        # Limpiar entradas expiradas
-        clean_expired_cache_entries()
-        
-        if file_hash in DOCUMENT_CACHE:
-            cache_entry = DOCUMENT_CACHE[file_hash]
-            logger.info(f"Documento encontrado en caché: {filepath} -> {file_hash}")
-            return True, cache_entry.get("result_path")
-        
-        return False, None
+        return False, None, file_hash
     except Exception as e:
-        logger.error(f"Error verificando caché para {filepath}: {e}")
-        return False, None
+        logger.error("Error verificando caché para %s: %s", filepath, e)
+        return False, None, file_hash
 
-def add_to_cache(filepath: str, result_path: str) -> None:
-    """Añade un documento procesado a la caché."""
+def add_to_cache(file_hash: str, result_path: str) -> None:
+    """Añade un documento procesado a la caché, usando el hash ya calculado en is_cached_document."""
+    if cache_db is None:
+        return
     try:
-        file_hash = get_file_hash(filepath)
-        DOCUMENT_CACHE[file_hash] = {
-            "timestamp": datetime.now(),
-            "result_path": result_path
-        }
-        logger.info(f"Documento añadido a caché: {filepath} -> {file_hash}")
+        with cache_lock:
+            cache_db.execute(
+                "INSERT OR REPLACE INTO doc_cache(hash, result_path, ts) VALUES (?, ?, ?)",
+                (file_hash, result_path, time.time()),
+            )
+            cache_db.commit()
+        logger.info("Documento añadido a caché: %s -> %s", result_path, file_hash)
+    except Exception as e:
+        logger.error("Error añadiendo documento a caché %s: %s", file_hash, e)
+
+def _is_presigned_storage_host(host: str) -> bool:
+    """Indica si el host sirve URLs pre-firmadas de Pipefy (su almacenamiento o S3)."""
+    return (
+        host == "pipefy.com" or host.endswith(".pipefy.com")
+        or host == "amazonaws.com" or host.endswith(".amazonaws.com")
+    )
+
+def url_cache_key(url: str) -> Optional[str]:
+    """
+    Clave de url_cache: la URL sin query ni fragmento, o None si no se puede cachear.
+    Solo las URLs pre-firmadas de Pipefy/S3 llevan en la ruta el ID inmutable de la
+    subida (la query solo trae firma y caducidad); en otro host la misma URL puede
+    servir contenido distinto, así que se descarga y se compara por hash.
+    """
+    parts = urlsplit(url)
+    if not _is_presigned_storage_host(parts.hostname or ""):
+        return None
+    return f"{parts.scheme}://{parts.netloc}{parts.path}"
+
+def get_cached_result_for_url(url: str) -> Optional[str]:
+    """Devuelve la ruta del resultado ya procesado para la URL del adjunto, si sigue vigente."""
+    key = url_cache_key(url)
+    if cache_db is None or key is None:
+        return None
+    try:
+        with cache_lock:
+            row = cache_db.execute(
+                "SELECT d.result_path FROM url_cache u JOIN doc_cache d ON d.hash = u.hash "
+                "WHERE u.url = ? AND u.ts > ? AND d.ts > ?",
+                (key, time.time() - CACHE_EXPIRY_HOURS * 3600, time.time() - CACHE_EXPIRY_HOURS * 3600),
+            ).fetchone()
+        return row[0] if row is not None else None
+    except Exception as e:
+        logger.error("Error consultando caché por URL para %s: %s", url, e)
+        return None
+
+def add_url_to_cache(url: str, file_hash: str) -> None:
+    """Asocia la URL del adjunto con el hash del archivo descargado (solo URLs pre-firmadas)."""
+    key = url_cache_key(url)
+    if cache_db is None or key is None:
+        return
+    try:
+        with cache_lock:
+            cache_db.execute(
+                "INSERT OR REPLACE INTO url_cache(url, hash, ts) VALUES (?, ?, ?)",
+                (key, file_hash, time.time()),
+            )
+            cache_db.commit()
+    except Exception as e:
+        logger.error("Error añadiendo URL a caché %s: %s", url, e)
+
+def get_cached_result_for_etag(etag_key: str) -> Optional[str]:
+    """Devuelve la ruta del resultado ya procesado para un ETag (clave 'host|etag'), si sigue vigente."""
+    if cache_db is None:
+        return None
+    try:
+        cutoff = time.time() - CACHE_EXPIRY_HOURS * 3600
+        with cache_lock:
+            row = cache_db.execute(
+                "SELECT d.result_path FROM etag_cache e JOIN doc_cache d ON d.hash = e.hash "
+                "WHERE e.etag = ? AND e.ts > ? AND d.ts > ?",
+                (etag_key, cutoff, cutoff),
+            ).fetchone()
+        return row[0] if row is not None else None
+    except Exception as e:
+        logger.error("Error consultando caché por ETag para %s: %s", etag_key, e)
+        return None
+
+def add_etag_to_cache(etag_key: str, file_hash: str) -> None:
+    """Asocia el ETag de una descarga con el hash del archivo descargado."""
+    if cache_db is None:
+        return
+    try:
+        with cache_lock:
+            cache_db.execute(
+                "INSERT OR REPLACE INTO etag_cache(etag, hash, ts) VALUES (?, ?, ?)",
+                (etag_key, file_hash, time.time()),
+            )
+            cache_db.commit()
     except Exception as e:
-        logger.error(f"Error añadiendo documento a caché {filepath}: {e}")
+        logger.error("Error añadiendo ETag a caché %s: %s", etag_key, e)
 
 def clean_expired_cache_entries() -> None:
-    """Limpia entradas expiradas del caché."""
+    """Borra las entradas de doc_cache, url_cache, etag_cache y webhook_seen que ya han expirado."""
+    if cache_db is None:
+        return
     try:
-        now = datetime.now()
-        expired_keys = []
-        
-        for file_hash, entry in DOCUMENT_CACHE.items():
-            cache_time = entry.get("timestamp")
-            if cache_time and (now - cache_time) > timedelta(hours=CACHE_EXPIRY_HOURS):
-                expired_keys.append(file_hash)
-        
-        for key in expired_keys:
-            del DOCUMENT_CACHE[key]
-            
-        if expired_keys:
-            logger.info(f"Limpiadas {len(expired_keys)} entradas expiradas de caché")
+        now = time.time()
+        with cache_lock:
+            deleted = cache_db.execute(
+                "DELETE FROM doc_cache WHERE ts < ?",
+                (now - CACHE_EXPIRY_HOURS * 3600,),
+            ).rowcount
+            deleted += cache_db.execute(
+                "DELETE FROM url_cache WHERE ts < ?",
+                (now - CACHE_EXPIRY_HOURS * 3600,),
+            ).rowcount
+            deleted += cache_db.execute(
+                "DELETE FROM etag_cache WHERE ts < ?",
+                (now - CACHE_EXPIRY_HOURS * 3600,),
+            ).rowcount
+            # Los webhooks aún en 'processing' se conservan para poder reencolarlos,
+            # salvo que lleven tanto tiempo como el propio caché de documentos
+            deleted_webhooks = cache_db.execute(
+                "DELETE FROM webhook_seen WHERE (status = 'done' AND ts < ?) OR ts < ?",
+                (now - WEBHOOK_DEDUP_EXPIRY, now - CACHE_EXPIRY_HOURS * 3600),
+            ).rowcount
+            cache_db.commit()
+        if deleted:
+            logger.info("Limpiadas %s entradas expiradas de caché", deleted)
+        if deleted_webhooks:
+            logger.info("Limpiados %s webhooks expirados de la deduplicación", deleted_webhooks)
     except Exception as e:
-        logger.error(f"Error limpiando entradas expiradas de caché: {e}")
+        logger.error("Error limpiando entradas expiradas de caché: %s", e)
+
+async def sweep_expired_cache_entries() -> None:
+    """
+    Tarea en segundo plano: limpia periódicamente el caché en lugar de hacerlo en cada
+    petición y reencola los webhooks atascados (p. ej. tras un reinicio rápido de Render).
+    """
+    while True:
+        clean_expired_cache_entries()
+        requeue_stale_webhooks()
+        await asyncio.sleep(CACHE_SWEEP_INTERVAL)
 
 # Sistema de deduplicación de webhooks
-def generate_webhook_id(payload: dict, card_id: str) -> str:
-    """Genera un ID único para un webhook basado en su contenido y tarjeta."""
-    webhook_data = f"{card_id}_{json.dumps(payload, sort_keys=True)}"
-    return hashlib.md5(webhook_data.encode()).hexdigest()
+def generate_webhook_id(payload: "PipefyWebhookInput") -> str:
+    """
+    Devuelve el ID de deduplicación de un webhook: el webhook_id que envía Pipefy
+    o, si falta, un hash de los campos pequeños y estables del evento.
+    """
+    if payload.webhook_id:
+        return payload.webhook_id
+    data = payload.data
+    webhook_data = f"{data.card.id}:{data.action}:{data.from_phase.id}:{data.to_phase.id}:{payload.timestamp}"
+    return hashlib.blake2b(webhook_data.encode(), digest_size=16).hexdigest()
 
 def is_duplicate_webhook(webhook_id: str, card_id: str) -> bool:
-    """Verifica si un webhook es duplicado basado en su ID."""
-    try:
-        clean_expired_webhook_entries()
-        
-        if webhook_id in WEBHOOK_CACHE:
-            webhook_info = WEBHOOK_CACHE[webhook_id]
-            elapsed = time.time() - webhook_info.get("timestamp", 0)
-            logger.info(f"Webhook duplicado detectado para tarjeta {card_id}, ID: {webhook_id}, hace {elapsed:.2f} segundos")
-            return True
-        
-        # No está en caché, lo añadimos
-        WEBHOOK_CACHE[webhook_id] = {
-            "timestamp": time.time(),
-            "card_id": card_id
-        }
+    """
+    Verifica si un webhook es duplicado basado en su ID.
+    La inserción es una única sentencia (check-and-set atómico): si no devuelve
+    fila, el webhook ya se vio dentro de la ventana WEBHOOK_DEDUP_EXPIRY.
+    Sin base de caché no hay deduplicación y todos los webhooks se procesan.
+    """
+    if cache_db is None:
         return False
+    try:
+        now = time.time()
+        with cache_lock:
+            # Una fila expirada que aún no ha barrido la limpieza se reutiliza
+            inserted = cache_db.execute(
+                "INSERT INTO webhook_seen(webhook_id, card_id, ts, status, attempts) VALUES (?, ?, ?, 'processing', 0) "
+                "ON CONFLICT(webhook_id) DO UPDATE SET card_id = excluded.card_id, ts = excluded.ts, "
+                "status = excluded.status, attempts = excluded.attempts "
+                "WHERE webhook_seen.ts < ? RETURNING 1",
+                (webhook_id, card_id, now, now - WEBHOOK_DEDUP_EXPIRY),
+            ).fetchone()
+            cache_db.commit()
+            if inserted is not None:
+                WEBHOOK_METRICS["seen_count"] += 1
+                return False
+            WEBHOOK_METRICS["duplicate_count"] += 1
+
+        logger.info("Webhook duplicado detectado para tarjeta %s, ID: %s", card_id, webhook_id)
+        return True
     except Exception as e:
-        logger.error(f"Error verificando duplicación de webhook {webhook_id}: {e}")
+        logger.error("Error verificando duplicación de webhook %s: %s", webhook_id, e)
         return False  # En caso de error, procesamos el webhook
 
-def clean_expired_webhook_entries() -> None:
-    """Limpia entradas expiradas del caché de webhooks."""
+def mark_webhook_done(webhook_id: Optional[str]) -> None:
+    """Marca un webhook como procesado, para que no se reencole al reiniciar."""
+    if webhook_id is None or cache_db is None:
+        return
+    try:
+        with cache_lock:
+            cache_db.execute("UPDATE webhook_seen SET status = 'done' WHERE webhook_id = ?", (webhook_id,))
+            cache_db.commit()
+    except Exception as e:
+        logger.error("Error marcando webhook %s como procesado: %s", webhook_id, e)
+
+def get_stale_webhooks() -> list:
+    """
+    Devuelve (webhook_id, card_id) de los webhooks que llevan demasiado tiempo en
+    'processing', salvo los que este proceso tiene en curso y los que ya agotaron
+    WEBHOOK_MAX_REQUEUES (esos los borra la limpieza cuando expira el caché).
+    """
+    if cache_db is None:
+        return []
     try:
         now = time.time()
-        expired_keys = []
-        
-        for webhook_id, entry in WEBHOOK_CACHE.items():
-            cache_time = entry.get("timestamp", 0)
-            if now - cache_time > WEBHOOK_DEDUP_EXPIRY:
-                expired_keys.append(webhook_id)
-        
-        for key in expired_keys:
-            del WEBHOOK_CACHE[key]
-            
-        if expired_keys:
-            logger.info(f"Limpiadas {len(expired_keys)} entradas expiradas de caché de webhooks")
+        with cache_lock:
+            # Una sola sentencia busca y reclama las filas (renueva ts y suma un intento):
+            # otro proceso que comparta la base no puede tomar las mismas
+            rows = cache_db.execute(
+                "UPDATE webhook_seen SET ts = ?, attempts = attempts + 1 "
+                "WHERE status = 'processing' AND ts < ? AND attempts < ? "
+                "AND webhook_id NOT IN (SELECT value FROM json_each(?)) "
+                "RETURNING webhook_id, card_id",
+                (now, now - WEBHOOK_REQUEUE_AFTER_MINUTES * 60, WEBHOOK_MAX_REQUEUES,
+                 orjson.dumps(list(_WEBHOOKS_IN_PROGRESS)).decode()),
+            ).fetchall()
+            cache_db.commit()
+        return rows
     except Exception as e:
-        logger.error(f"Error limpiando entradas expiradas de caché de webhooks: {e}")
+        logger.error("Error buscando webhooks pendientes de procesar: %s", e)
+        return []
 
 # --- Nuevos Modelos Pydantic para el Payload card.move ---
 
 class PhaseInfo(BaseModel):
-    id: Union[str, int]  # Acepta tanto strings como integers
+    model_config = ConfigDict(extra='ignore')
+
+    id: str  # Pipefy lo envía como string o como integer
     name: str
 
+    @field_validator('id', mode='before')
+    @classmethod
+    def _id_as_str(cls, v: Any) -> Any:
+        return str(v) if isinstance(v, int) else v
+
 class CardInfo(BaseModel):
-    id: Union[str, int]  # Acepta tanto strings como integers
+    model_config = ConfigDict(extra='ignore')
+
+    id: str  # Pipefy lo envía como string o como integer
     title: Optional[str] = None
-    pipe_id: Union[str, int]  # Acepta tanto strings como integers
+    pipe_id: str  # Pipefy lo envía como string o como integer
+
+    @field_validator('id', 'pipe_id', mode='before')
+    @classmethod
+    def _ids_as_str(cls, v: Any) -> Any:
+        return str(v) if isinstance(v, int) else v
 
 class UserInfo(BaseModel):
-    id: Union[str, int]  # Acepta tanto strings como integers
+    model_config = ConfigDict(extra='ignore')
+
+    id: str  # Pipefy lo envía como string o como integer
     name: str
     username: Optional[str] = None
     email: Optional[str] = None
 
+    @field_validator('id', mode='before')
+    @classmethod
+    def _id_as_str(cls, v: Any) -> Any:
+        return str(v) if isinstance(v, int) else v
+
 class CardMoveData(BaseModel):
+    # populate_by_name: acepta tanto 'from'/'to' (alias de Pipefy) como from_phase/to_phase
+    model_config = ConfigDict(extra='ignore', populate_by_name=True)
+
     action: str
     from_phase: PhaseInfo = Field(..., alias='from')
     to_phase: PhaseInfo = Field(..., alias='to')
@@ -178,6 +500,8 @@ class CardMoveData(BaseModel):
     card: CardInfo
 
 class PipefyWebhookInput(BaseModel):
+    model_config = ConfigDict(extra='ignore')
+
     data: CardMoveData
     timestamp: Optional[str] = None
     webhook_id: Optional[str] = None
@@ -186,102 +510,214 @@ class PipefyWebhookInput(BaseModel):
 
 # Aplicación FastAPI
 app = FastAPI(
+    default_response_class=ORJSONResponse,
     title="Procesador Pipefy Agentic-Doc v2",
     description="Recibe webhooks card.move de Pipefy, obtiene adjuntos vía GraphQL y los procesa con agentic-doc."
 )
 
-async def get_pipefy_attachment_url(card_id: str) -> Optional[str]:
-    """Obtiene la URL del adjunto de una tarjeta específica vía GraphQL."""
-    if not PIPEFY_TOKEN:
-        logger.error(f"PIPEFY_TOKEN no configurado. No se puede obtener detalles para tarjeta {card_id}.")
-        return None
-    if not ATTACHMENT_FIELD_ID or ATTACHMENT_FIELD_ID == "id_del_campo_adjunto":
-         logger.error(f"PIPEFY_ATTACHMENT_FIELD_ID no configurado o sigue con el valor por defecto. No se puede obtener adjunto para tarjeta {card_id}.")
-         return None
+@app.on_event("startup")
+async def startup_http_client():
+    """
+    Crea un único cliente HTTP compartido para reutilizar conexiones con Pipefy.
+    El token no va en el cliente: las descargas a URLs pre-firmadas no deben llevarlo.
+    """
+    app.state.http = httpx.AsyncClient(
+        base_url=PIPEFY_API_BASE_URL,
+        http2=True,
+        timeout=20.0,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+    )
 
-    headers = {
-        "Authorization": f"Bearer {PIPEFY_TOKEN}",
-        "Content-Type": "application/json",
-    }
-    # Primer paso: Obtener los IDs de los adjuntos disponibles para esta tarjeta
-    query = f"""
-    query GetCardAttachments {{
-      card(id: "{card_id}") {{
-        attachments {{
-          path
-          url
-        }}
-        fields {{
-          name
-          field {{
-            id
-          }}
-          value
-          array_value
-        }}
-      }}
-    }}
-    """
-    async with httpx.AsyncClient(timeout=20.0) as client:
+@app.on_event("shutdown")
+async def shutdown_http_client():
+    """Cierra el cliente HTTP compartido."""
+    await app.state.http.aclose()
+
+@app.on_event("startup")
+async def startup_cache_db():
+    """
+    Abre la base del caché de documentos y lanza su limpieza periódica (que también
+    reencola webhooks). Si la base no se puede abrir, el servicio arranca sin caché.
+    """
+    global cache_db
+    try:
+        cache_db = init_cache_db()
+    except (OSError, sqlite3.Error) as e:
+        logger.error("No se pudo abrir la base de caché %s; se continúa sin caché ni deduplicación: %s", CACHE_DB_PATH, e)
+        cache_db = None
+    app.state.requeued = set()
+    app.state.cache_sweeper = asyncio.create_task(sweep_expired_cache_entries())
+
+@app.on_event("shutdown")
+async def shutdown_cache_db():
+    """Detiene la limpieza periódica y cierra la base del caché."""
+    app.state.cache_sweeper.cancel()
+    if cache_db is not None:
+        with cache_lock:
+            cache_db.close()
+
+@app.on_event("startup")
+async def startup_parser_pool():
+    """Crea el pool acotado de hilos donde se ejecuta agentic-doc."""
+    global PARSER_POOL
+    PARSER_POOL = ThreadPoolExecutor(max_workers=PARSE_CONCURRENCY, thread_name_prefix="parser")
+
+@app.on_event("shutdown")
+async def shutdown_parser_pool():
+    """Cierra el pool de procesamiento sin esperar a los documentos en curso."""
+    PARSER_POOL.shutdown(wait=False, cancel_futures=True)
+
+def requeue_stale_webhooks() -> None:
+    """Reencola los webhooks aceptados que no llegaron a completarse (entrega al menos una vez)."""
+    for webhook_id, card_id in get_stale_webhooks():
+        logger.info("Reencolando procesamiento pendiente de tarjeta %s (webhook %s)", card_id, webhook_id)
+        task = asyncio.create_task(process_card(card_id, webhook_id))
+        app.state.requeued.add(task)
+        task.add_done_callback(app.state.requeued.discard)
+
+@lru_cache(maxsize=CARD_BATCH_MAX_SIZE)
+def build_cards_query(size: int) -> str:
+    """Construye una consulta GraphQL con alias c0..cN para obtener varias tarjetas a la vez."""
+    params = ", ".join(f"$c{i}: ID!" for i in range(size))
+    selections = "\n".join(f"  c{i}: card(id: $c{i}) {{ ...CardAttachments }}" for i in range(size))
+    return f"query GetCardsAttachments({params}) {{\n{selections}\n}}\n{_CARD_ATTACHMENTS_FRAGMENT}"
+
+class CardFieldLoader:
+    """
+    Agrupa las consultas de tarjetas que llegan dentro de una ventana corta
+    (p. ej. ráfagas de card.move) en una única petición GraphQL con alias.
+    """
+
+    def __init__(self, window: float = CARD_BATCH_WINDOW, max_batch: int = CARD_BATCH_MAX_SIZE):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: deque = deque()
+        self._task: Optional[asyncio.Task] = None
+        # Lotes enviados y aún sin respuesta (se guarda la referencia a cada tarea)
+        self._dispatching: set = set()
+
+    async def load(self, card_id: str) -> Optional[Dict[str, Any]]:
+        """Encola la tarjeta y espera sus datos (o None si Pipefy no la devuelve)."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((card_id, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self) -> None:
+        while self._queue:
+            await asyncio.sleep(self.window)
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            # Cada lote va en su propia tarea: una consulta lenta no retrasa los lotes siguientes
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatching.add(task)
+            task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, batch: list) -> None:
+        # Una misma tarjeta solicitada varias veces se consulta una sola vez
+        pending: Dict[str, list] = {}
+        for card_id, future in batch:
+            pending.setdefault(card_id, []).append(future)
+        aliases = {f"c{i}": card_id for i, card_id in enumerate(pending)}
+
+        # Cualquier fallo (también un cuerpo JSON que no sea un objeto) se entrega a
+        # todas las tarjetas del lote; si no, quedarían esperando indefinidamente
         try:
-            logger.info(f"Consultando API GraphQL de Pipefy para adjuntos de tarjeta {card_id}...")
-            response = await client.post(PIPEFY_GRAPHQL_ENDPOINT, json={'query': query}, headers=headers)
+            logger.info("Consultando API GraphQL de Pipefy para %s tarjeta(s) en una sola petición...", len(aliases))
+            response = await app.state.http.post(
+                PIPEFY_GRAPHQL_PATH,
+                content=orjson.dumps({'query': build_cards_query(len(aliases)), 'variables': aliases}),
+                headers=_PIPEFY_AUTH_HEADER,
+            )
             response.raise_for_status()
-            data = response.json()
+            data = orjson.loads(response.content)
 
-            if 'errors' in data:
-                logger.error(f"Error en GraphQL al obtener adjuntos para tarjeta {card_id}: {data['errors']}")
-                return None
+            errors = data.get('errors')
+            if errors:
+                logger.error("Error en GraphQL al obtener adjuntos para tarjetas %s: %s", list(pending), errors)
 
-            card_data = data.get('data', {}).get('card')
-            if not card_data:
-                logger.warning(f"No se encontró la tarjeta {card_id} en la respuesta GraphQL.")
-                return None
-            
-            # Primero verificamos si hay attachments directos
-            if card_data.get('attachments') and len(card_data['attachments']) > 0:
-                for attachment in card_data['attachments']:
-                    if attachment.get('url'):
-                        logger.info(f"URL de adjunto encontrada para tarjeta {card_id}: {attachment['url']}")
-                        return attachment['url']
-            
-            # Si no hay attachments directos, buscamos en los campos
-            if not card_data.get('fields'):
-                logger.warning(f"No se encontraron campos para la tarjeta {card_id}.")
-                return None
-
-            # Buscar el campo de archivo adjunto por su ID
-            for field_info in card_data['fields']:
-                field_id = field_info.get('field', {}).get('id')
-                if field_id == ATTACHMENT_FIELD_ID:
-                    logger.info(f"Campo de adjunto encontrado para tarjeta {card_id}.")
-                    
-                    # Si hay un valor de array que contiene archivos
-                    if field_info.get('array_value') and isinstance(field_info['array_value'], list) and len(field_info['array_value']) > 0:
-                        attachment_info = field_info['array_value'][0]
-                        logger.info(f"Información de adjunto en array_value: {attachment_info}")
-                        # Podría ser una URL directa o un identificador
-                        if isinstance(attachment_info, str):
-                            if attachment_info.startswith('http'):
-                                return attachment_info
-                    
-                    # Si hay un valor simple que es una URL
-                    if isinstance(field_info.get('value'), str) and field_info['value'].startswith('http'):
-                        logger.info(f"URL encontrada en 'value' para tarjeta {card_id}.")
-                        return field_info['value']
-                    
-                    logger.warning(f"Campo de adjunto {ATTACHMENT_FIELD_ID} encontrado para tarjeta {card_id}, pero no se pudo extraer URL.")
-                    return None
+            cards = data.get('data') or {}
+            for alias, card_id in aliases.items():
+                card = cards.get(alias)
+                for future in pending[card_id]:
+                    if future.done():
+                        continue
+                    # Con errores GraphQL, una tarjeta sin datos es un fallo de la consulta
+                    # (se reintenta más tarde), no una tarjeta inexistente
+                    if card is None and errors:
+                        future.set_exception(RuntimeError(f"Error GraphQL para tarjeta {card_id}: {errors}"))
+                    else:
+                        future.set_result(card)
+        except Exception as e:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+
+card_loader = CardFieldLoader()
 
-            logger.warning(f"Campo de adjunto con ID '{ATTACHMENT_FIELD_ID}' no encontrado para tarjeta {card_id}.")
+async def get_pipefy_attachment_url(card_id: str) -> Optional[str]:
+    """
+    Obtiene la URL del adjunto de una tarjeta específica vía GraphQL.
+    Retorna None si la tarjeta no tiene adjunto; si falla la consulta a Pipefy
+    (red, código HTTP de error o errores GraphQL) se propaga la excepción.
+    """
+    if not PIPEFY_TOKEN:
+        logger.error("PIPEFY_TOKEN no configurado. No se puede obtener detalles para tarjeta %s.", card_id)
+        return None
+    if not _ATTACHMENT_CONFIGURED:
+         logger.error("PIPEFY_ATTACHMENT_FIELD_ID no configurado o sigue con el valor por defecto. No se puede obtener adjunto para tarjeta %s.", card_id)
+         return None
+
+    try:
+        card_data = await card_loader.load(card_id)
+        if not card_data:
+            logger.warning("No se encontró la tarjeta %s en la respuesta GraphQL.", card_id)
             return None
+        
+        # Primero verificamos si hay attachments directos
+        for attachment in card_data.get('attachments') or []:
+            if url := attachment.get('url'):
+                logger.info("URL de adjunto encontrada para tarjeta %s: %s", card_id, url)
+                return url
 
-        except httpx.RequestError as e:
-            logger.error(f"Error de red llamando a API Pipefy para tarjeta {card_id}: {e}")
+        # Si no hay attachments directos, buscamos en los campos
+        fields = card_data.get('fields') or []
+        if not fields:
+            logger.warning("No se encontraron campos para la tarjeta %s.", card_id)
             return None
-        except Exception as e:
-            logger.error(f"Error inesperado procesando respuesta GraphQL para tarjeta {card_id}: {e}")
+
+        # Buscar el campo de archivo adjunto por su ID
+        field_info = next((f for f in fields if (f.get('field') or {}).get('id') == ATTACHMENT_FIELD_ID), None)
+        if field_info is None:
+            logger.warning("Campo de adjunto con ID '%s' no encontrado para tarjeta %s.", ATTACHMENT_FIELD_ID, card_id)
             return None
+        logger.info("Campo de adjunto encontrado para tarjeta %s.", card_id)
+
+        # Si hay un valor de array con archivos, usamos la primera entrada que sea una URL
+        array_value = field_info.get('array_value')
+        if isinstance(array_value, list):
+            for attachment_info in array_value:
+                if isinstance(attachment_info, str) and attachment_info.startswith('http'):
+                    logger.info("URL encontrada en 'array_value' para tarjeta %s.", card_id)
+                    return attachment_info
+            if array_value:
+                logger.info("Información de adjunto en array_value sin URL: %s", array_value)
+
+        # Si hay un valor simple que es una URL
+        if isinstance(value := field_info.get('value'), str) and value.startswith('http'):
+            logger.info("URL encontrada en 'value' para tarjeta %s.", card_id)
+            return value
+
+        logger.warning("Campo de adjunto %s encontrado para tarjeta %s, pero no se pudo extraer URL.", ATTACHMENT_FIELD_ID, card_id)
+        return None
+
+    except httpx.RequestError as e:
+        logger.error("Error de red llamando a API Pipefy para tarjeta %s: %s", card_id, e)
+        raise
+    except Exception as e:
+        logger.error("Error inesperado procesando respuesta GraphQL para tarjeta %s: %s", card_id, e)
+        raise
 
 async def get_pipefy_attachment_download_url(attachment_id: str) -> Optional[str]:
     """Obtiene la URL firmada de descarga para un adjunto de Pipefy utilizando su ID."""
@@ -289,250 +725,354 @@ async def get_pipefy_attachment_download_url(attachment_id: str) -> Optional[str
         logger.error("PIPEFY_TOKEN no configurado. No se puede obtener URL de descarga.")
         return None
     
-    headers = {
-        "Authorization": f"Bearer {PIPEFY_TOKEN}",
-        "Content-Type": "application/json",
-    }
-    
-    # Query GraphQL para obtener la URL de descarga directa usando getPresignedUrl
-    query = f"""
-    query GetPresignedUrl {{
-      getPresignedUrl(input: {{ attachableId: "{attachment_id}" }}) {{
-        signedUrl
-      }}
-    }}
-    """
-    
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        try:
-            logger.info(f"Consultando API GraphQL de Pipefy para URL firmada del adjunto: {attachment_id}...")
-            response = await client.post(PIPEFY_GRAPHQL_ENDPOINT, json={'query': query}, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            
-            if 'errors' in data:
-                logger.error(f"Error en GraphQL al obtener URL firmada: {data['errors']}")
-                return None
-            
-            signed_url = data.get('data', {}).get('getPresignedUrl', {}).get('signedUrl')
-            if not signed_url:
-                logger.warning(f"No se pudo obtener URL firmada para el adjunto {attachment_id}")
-                return None
-            
-            logger.info(f"URL firmada obtenida exitosamente para adjunto {attachment_id}")
-            return signed_url
-            
-        except httpx.RequestError as e:
-            logger.error(f"Error de red obteniendo URL firmada para adjunto {attachment_id}: {e}")
+    client = app.state.http
+    try:
+        logger.info("Consultando API GraphQL de Pipefy para URL firmada del adjunto: %s...", attachment_id)
+        response = await client.post(
+            PIPEFY_GRAPHQL_PATH,
+            content=orjson.dumps({'query': _PRESIGNED_URL_QUERY, 'variables': {'aid': attachment_id}}),
+            headers=_PIPEFY_AUTH_HEADER,
+        )
+        response.raise_for_status()
+        data = orjson.loads(response.content)
+        
+        if 'errors' in data:
+            logger.error("Error en GraphQL al obtener URL firmada: %s", data['errors'])
             return None
-        except Exception as e:
-            logger.error(f"Error inesperado obteniendo URL firmada para adjunto {attachment_id}: {e}")
+        
+        signed_url = data.get('data', {}).get('getPresignedUrl', {}).get('signedUrl')
+        if not signed_url:
+            logger.warning("No se pudo obtener URL firmada para el adjunto %s", attachment_id)
             return None
+        
+        logger.info("URL firmada obtenida exitosamente para adjunto %s", attachment_id)
+        return signed_url
+        
+    except httpx.RequestError as e:
+        logger.error("Error de red obteniendo URL firmada para adjunto %s: %s", attachment_id, e)
+        return None
+    except Exception as e:
+        logger.error("Error inesperado obteniendo URL firmada para adjunto %s: %s", attachment_id, e)
+        return None
+
+def _is_pipefy_host(url: str) -> bool:
+    """Indica si la URL apunta a un dominio de Pipefy (que sí requiere el token)."""
+    host = urlsplit(url).hostname or ""
+    return host == "pipefy.com" or host.endswith(".pipefy.com")
+
+def remove_temp_file(path: str) -> None:
+    """Elimina un archivo temporal; si ya no existe no hace nada."""
+    try:
+        os.unlink(path)
+        logger.info("Archivo temporal limpiado: %s", path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.error("Error eliminando archivo temporal %s: %s", path, e)
+
+@contextmanager
+def temp_file(path: str):
+    """Entrega la ruta del archivo temporal y lo elimina al salir del bloque."""
+    try:
+        yield path
+    finally:
+        remove_temp_file(path)
+
+def link_or_copy(src: str, dst: str) -> None:
+    """
+    Publica src también como dst: enlace duro si ambos están en el mismo disco
+    (sin copiar bytes) o copia con shutil.copyfile si no. Reemplaza dst de forma atómica.
+    """
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+    tmp_path = f"{dst}.{uuid.uuid4().hex}.tmp"
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
 
-async def download_file(attachment_url: str, card_id: str) -> Optional[str]:
-    """Descarga un archivo de Pipefy usando la URL del adjunto."""
+async def download_file(attachment_url: str, card_id: str) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Descarga un archivo de Pipefy usando la URL del adjunto.
+    Retorna (ruta_local, clave_etag, ruta_resultado_cacheado). Si el ETag de la
+    respuesta ya corresponde a un resultado procesado, se corta la descarga tras
+    las cabeceras y solo se devuelve ese resultado. Solo cuentan los ETags fuertes
+    del almacenamiento pre-firmado de Pipefy/S3 (en otros servidores un ETag débil,
+    de tipo "mtime-tamaño" o fijo puede coincidir entre archivos distintos).
+    """
     if not PIPEFY_TOKEN:
         logger.error("Variable de entorno PIPEFY_TOKEN no configurada.")
-        return None
+        return None, None, None
     if not attachment_url:
-        logger.warning(f"No se proporcionó URL de adjunto para la tarjeta {card_id}.")
-        return None
+        logger.warning("No se proporcionó URL de adjunto para la tarjeta %s.", card_id)
+        return None, None, None
     
-    headers = {"Authorization": f"Bearer {PIPEFY_TOKEN}"}
     local_filepath = None
     
     try:
-        # Crear directorio de salida si no existe
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        
-        # Determinar la extensión del archivo
-        try:
-            # Intentar extraer la extensión de la URL
-            url_parts = attachment_url.split('?')[0].split('/')[-1]
-            file_ext = os.path.splitext(url_parts)[1] or ".tmp"
-        except Exception:
-            file_ext = ".tmp"
-            
+        # Determinar la extensión del archivo a partir de la URL
+        ext_match = _EXT_RE.search(attachment_url)
+        file_ext = f".{ext_match.group(1)}" if ext_match else ".tmp"
+
         temp_filename = f"{card_id}_{uuid.uuid4()}{file_ext}"
         local_filepath = os.path.join(OUTPUT_DIR, temp_filename)
 
-        logger.info(f"Intentando descargar adjunto para tarjeta {card_id} desde {attachment_url} a {local_filepath}")
+        logger.info("Intentando descargar adjunto para tarjeta %s desde %s a %s", card_id, attachment_url, local_filepath)
         
         # Descargar usando la URL
-        with requests.get(attachment_url, headers=headers, stream=True, timeout=60) as r:
+        # Las URLs pre-firmadas (p. ej. S3) ya llevan su autenticación; enviarles
+        # además el token de Pipefy provoca rechazos por métodos de auth en conflicto
+        client = app.state.http
+        headers = _PIPEFY_AUTH_HEADER if _is_pipefy_host(attachment_url) else None
+        async with client.stream("GET", attachment_url, headers=headers, timeout=60, follow_redirects=True) as r:
             r.raise_for_status()
-            with open(local_filepath, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            logger.info(f"Adjunto descargado exitosamente para tarjeta {card_id} en {local_filepath}")
-            return local_filepath
-
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error descargando archivo para tarjeta {card_id}: {e}")
-        if local_filepath and os.path.exists(local_filepath):
-            os.remove(local_filepath)
-        return None
+            # El ETag se asocia al host que sirve el archivo (tras redirecciones)
+            etag = r.headers.get("etag")
+            etag_key = (
+                f"{r.url.netloc.decode()}|{etag}"
+                if etag and not etag.startswith("W/") and _is_presigned_storage_host(r.url.host)
+                else None
+            )
+            cached_result_path = get_cached_result_for_etag(etag_key) if etag_key else None
+            if cached_result_path and os.path.exists(cached_result_path):
+                logger.info("ETag %s ya procesado; se omite la descarga del adjunto para tarjeta %s", etag, card_id)
+                return None, etag_key, cached_result_path
+            async with aiofiles.open(local_filepath, 'wb') as f:
+                async for chunk in r.aiter_bytes(65536):
+                    await f.write(chunk)
+            logger.info("Adjunto descargado exitosamente para tarjeta %s en %s", card_id, local_filepath)
+            return local_filepath, etag_key, None
+
+    except httpx.HTTPError as e:
+        logger.error("Error descargando archivo para tarjeta %s: %s", card_id, e)
     except Exception as e:
-        logger.error(f"Error inesperado durante la descarga para tarjeta {card_id}: {e}")
-        if local_filepath and os.path.exists(local_filepath):
-            os.remove(local_filepath)
-        return None
+        logger.error("Error inesperado durante la descarga para tarjeta %s: %s", card_id, e)
+    if local_filepath:
+        remove_temp_file(local_filepath)
+    return None, None, None
 
-def save_results(card_id: str, markdown_content: str, chunks: list) -> str:
+async def save_results(card_id: str, markdown_content: str, chunks: list) -> str:
     """
-    Guarda los resultados procesados.
+    Guarda los resultados procesados (el directorio de salida se crea al arrancar).
     Retorna la ruta del archivo Markdown generado.
     """
     try:
-        logger.info(f"Creando directorio de salida: {OUTPUT_DIR}")
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        
-        # Verificar que el directorio existe realmente
-        if not os.path.exists(OUTPUT_DIR):
-            logger.error(f"¡ALERTA! No se pudo crear el directorio {OUTPUT_DIR}")
-            # Intentar crear directamente /data
-            os.makedirs("/data", exist_ok=True)
-            if os.path.exists("/data"):
-                logger.info("Directorio /data existe y es accesible")
-            else:
-                logger.error("¡ALERTA! No se puede acceder al directorio /data")
-
         md_filename = os.path.join(OUTPUT_DIR, f"{card_id}_extracted.md")
-        logger.info(f"Guardando resultados en: {md_filename}")
+        logger.info("Guardando resultados en: %s", md_filename)
         
-        with open(md_filename, "w", encoding="utf-8") as f:
-            f.write(markdown_content)
-        
-        # Verificar que el archivo se ha creado
-        if os.path.exists(md_filename):
-            logger.info(f"Archivo guardado exitosamente: {md_filename} ({os.path.getsize(md_filename)} bytes)")
-        else:
-            logger.error(f"¡ALERTA! No se pudo verificar la existencia del archivo: {md_filename}")
+        # Se escribe en un temporal y se renombra: si md_filename es un enlace duro
+        # a otro resultado cacheado, truncarlo en el sitio alteraría también el otro
+        tmp_filename = f"{md_filename}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(tmp_filename, "w", encoding="utf-8") as f:
+            await f.write(markdown_content)
+        await aiofiles.os.replace(tmp_filename, md_filename)
+        logger.info("Archivo guardado exitosamente: %s (%s bytes)", md_filename, await aiofiles.os.path.getsize(md_filename))
             
         return md_filename
 
     except Exception as e:
-        logger.error(f"Error guardando resultados para tarjeta {card_id}: {e}", exc_info=True)
+        logger.error("Error guardando resultados para tarjeta %s: %s", card_id, e, exc_info=True)
+        return ""
+
+async def parse_and_save(card_id: str, file_path: str) -> str:
+    """
+    Procesa el documento con agentic-doc en PARSER_POOL y guarda el Markdown.
+    Retorna la ruta del resultado, o "" si agentic-doc no devolvió nada.
+    """
+    logger.info("Iniciando procesamiento con agentic-doc para archivo: %s", file_path)
+
+    if not VISION_AGENT_API_KEY:
+        logger.warning("Variable de entorno VISION_AGENT_API_KEY no configurada. agentic-doc podría fallar o tener funcionalidad limitada.")
+
+    results = await asyncio.get_running_loop().run_in_executor(PARSER_POOL, parse_documents, [file_path])
+
+    if not results or len(results) == 0:
+        logger.error("agentic-doc no retornó resultados para %s", file_path)
         return ""
 
+    parsed_doc = results[0]
+    logger.info("Documento procesado exitosamente para tarjeta %s con agentic-doc.", card_id)
+
+    # Guardar resultados
+    return await save_results(card_id, parsed_doc.markdown, parsed_doc.chunks)
+
+async def process_card(card_id: str, webhook_id: Optional[str] = None) -> None:
+    """
+    Obtiene el adjunto de la tarjeta vía GraphQL, lo descarga y lo procesa con agentic-doc.
+    Se ejecuta en segundo plano, después de responder al webhook; si termina bien
+    marca el webhook como 'done' (si falla queda en 'processing' y se reencola más tarde).
+    """
+    if webhook_id is not None:
+        _WEBHOOKS_IN_PROGRESS.add(webhook_id)
+    try:
+        await _process_card(card_id, webhook_id)
+    finally:
+        _WEBHOOKS_IN_PROGRESS.discard(webhook_id)
+
+async def _process_card(card_id: str, webhook_id: Optional[str]) -> None:
+    try:
+        attachment_url = await get_pipefy_attachment_url(card_id)
+    except Exception:
+        # Fallo de Pipefy (ya registrado): el webhook sigue en 'processing' y se reencola
+        return
+
+    if not attachment_url:
+        logger.warning("No se pudo obtener URL de adjunto para tarjeta %s o no existe. Omitiendo procesamiento del adjunto.", card_id)
+        # Sin adjunto no hay nada que reintentar
+        mark_webhook_done(webhook_id)
+        return
+
+    # Si este mismo adjunto (URL pre-firmada) ya se procesó, no hace falta descargarlo ni calcular su hash
+    md_filename = os.path.join(OUTPUT_DIR, f"{card_id}_extracted.md")
+    cached_result_path = get_cached_result_for_url(attachment_url)
+    if cached_result_path:
+        try:
+            await asyncio.to_thread(link_or_copy, cached_result_path, md_filename)
+            logger.info("Adjunto ya procesado para tarjeta %s (caché por URL): %s", card_id, md_filename)
+            mark_webhook_done(webhook_id)
+            return
+        except FileNotFoundError:
+            logger.warning("Resultado en caché por URL ya no existe: %s", cached_result_path)
+
+    downloaded_file_path, etag_key, cached_result_path = await download_file(attachment_url, card_id)
+
+    if cached_result_path:
+        try:
+            await asyncio.to_thread(link_or_copy, cached_result_path, md_filename)
+            logger.info("Adjunto ya procesado para tarjeta %s (caché por ETag): %s", card_id, md_filename)
+            mark_webhook_done(webhook_id)
+            return
+        except OSError as e:
+            logger.error("Error enlazando resultado en caché por ETag %s para tarjeta %s: %s", cached_result_path, card_id, e)
+            return
+
+    if not downloaded_file_path:
+        logger.error("Fallo al descargar adjunto desde %s para tarjeta %s. Abortando.", attachment_url, card_id)
+        return
+
+    with temp_file(downloaded_file_path):
+        try:
+            # Verificar caché (el hash del archivo completo se calcula fuera del event loop)
+            is_cached, cached_result_path, file_hash = await asyncio.to_thread(is_cached_document, downloaded_file_path)
+        
+            if is_cached and cached_result_path and os.path.exists(cached_result_path):
+                logger.info("Usando resultado en caché para tarjeta %s: %s", card_id, cached_result_path)
+            
+                # Enlazar (o copiar) el resultado cacheado como archivo específico de esta tarjeta
+                await asyncio.to_thread(link_or_copy, cached_result_path, md_filename)
+                add_url_to_cache(attachment_url, file_hash)
+                if etag_key:
+                    add_etag_to_cache(etag_key, file_hash)
+            
+                logger.info("Resultado cacheado copiado para tarjeta %s en %s", card_id, md_filename)
+                mark_webhook_done(webhook_id)
+                return
+        
+            # Si el mismo documento ya se está procesando para otra tarjeta, se espera
+            # su resultado en lugar de lanzar un segundo parse. Consultar y registrar
+            # la entrada ocurre sin await de por medio, así que es atómico en el event loop.
+            in_flight = _PARSES_IN_FLIGHT.get(file_hash) if file_hash else None
+            if in_flight is not None:
+                logger.info("Documento %s ya en procesamiento; tarjeta %s espera su resultado", file_hash, card_id)
+                first_result = await asyncio.shield(in_flight)
+                if not first_result:
+                    logger.error("El procesamiento concurrente del documento %s falló; tarjeta %s sin resultado", file_hash, card_id)
+                    return
+                await asyncio.to_thread(link_or_copy, first_result, md_filename)
+                add_url_to_cache(attachment_url, file_hash)
+                if etag_key:
+                    add_etag_to_cache(etag_key, file_hash)
+                logger.info("Resultado concurrente copiado para tarjeta %s en %s", card_id, md_filename)
+                mark_webhook_done(webhook_id)
+                return
+
+            # Si no está en caché, procesar normalmente
+            parse_done = asyncio.get_running_loop().create_future()
+            if file_hash:
+                _PARSES_IN_FLIGHT[file_hash] = parse_done
+            md_filename = ""
+            try:
+                md_filename = await parse_and_save(card_id, downloaded_file_path)
+            finally:
+                if file_hash:
+                    _PARSES_IN_FLIGHT.pop(file_hash, None)
+                parse_done.set_result(md_filename)
+
+            if not md_filename:
+                return
+            # Añadir a caché
+            if file_hash:
+                add_to_cache(file_hash, md_filename)
+                add_url_to_cache(attachment_url, file_hash)
+                if etag_key:
+                    add_etag_to_cache(etag_key, file_hash)
+            mark_webhook_done(webhook_id)
+
+            logger.info("Procesamiento completado exitosamente para tarjeta %s", card_id)
+        except Exception as e:
+            logger.error("Error durante el procesamiento con agentic-doc o guardando resultados para %s: %s", downloaded_file_path, e, exc_info=True)
+
 @app.post("/webhook/pipefy")
 async def handle_pipefy_webhook(
-    payload: PipefyWebhookInput,
     request: Request,
+    background_tasks: BackgroundTasks,
     authorization: Optional[str] = Header(None)
 ):
     """
     Recibe notificaciones webhook card.move de Pipefy.
-    Obtiene la URL del adjunto vía GraphQL y lo procesa usando agentic-doc.
+    Valida y autentica el webhook, responde 202 de inmediato y deja el
+    procesamiento del adjunto en una tarea en segundo plano.
     """
-    # También mantenemos el logging del cuerpo para diagnóstico
     raw_body = await request.body()
-    logger.info("--- INICIO RAW BODY RECIBIDO ---")
     try:
-        raw_body_str = raw_body.decode('utf-8')
-        logger.info(raw_body_str)
-        
-        # Verificar duplicación del webhook
-        card_id = str(payload.data.card.id)
-        webhook_id = generate_webhook_id(json.loads(raw_body_str), card_id)
-        
-        if is_duplicate_webhook(webhook_id, card_id):
-            logger.info(f"Omitiendo procesamiento de webhook duplicado para tarjeta {card_id}")
-            return {"status": "success", "message": f"Webhook duplicado para tarjeta {card_id}, ignorado", "duplicate": True}
-            
-    except Exception as e:
-        logger.error(f"Error procesando raw body o verificando duplicación: {e}")
-        # Continuamos con el procesamiento normal en caso de error
-    logger.info("--- FIN RAW BODY RECIBIDO ---")
-    
-    # Convertir IDs a string si es necesario
-    card_id = str(payload.data.card.id)
-    logger.info(f"Webhook '{payload.data.action}' recibido para tarjeta ID: {card_id}")
+        payload = PipefyWebhookInput.model_validate_json(raw_body)
+    except ValidationError as e:
+        # Mismo formato que la validación de FastAPI, con la ubicación bajo "body"
+        raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors()])
+    # El cuerpo completo solo se registra en nivel DEBUG, para diagnóstico
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("raw body: %s", raw_body[:2048].decode('utf-8', 'replace'))
+    card_id = payload.data.card.id
+    logger.info("Webhook '%s' recibido para tarjeta ID: %s", payload.data.action, card_id)
 
-    if PIPEFY_WEBHOOK_SECRET:
+    if _EXPECTED_AUTH is not None:
         if not authorization:
-            logger.warning(f"Falta encabezado de Autorización para tarjeta {card_id}")
+            logger.warning("Falta encabezado de Autorización para tarjeta %s", card_id)
             raise HTTPException(status_code=401, detail="Falta encabezado de Autorización")
-        if authorization != f"Bearer {PIPEFY_WEBHOOK_SECRET}":
-            logger.warning(f"Encabezado de Autorización inválido para tarjeta {card_id}")
+        if not secrets.compare_digest(authorization.encode(), _EXPECTED_AUTH):
+            logger.warning("Encabezado de Autorización inválido para tarjeta %s", card_id)
             raise HTTPException(status_code=403, detail="Token de autorización inválido")
-        logger.info(f"Webhook autenticado exitosamente para tarjeta {card_id}.")
+        logger.info("Webhook autenticado exitosamente para tarjeta %s.", card_id)
     else:
          logger.warning("PIPEFY_WEBHOOK_SECRET (o RENDER_SERVICE_SECRET) no configurado. El webhook no está protegido.")
 
-    attachment_url = await get_pipefy_attachment_url(card_id)
-
-    if not attachment_url:
-        logger.warning(f"No se pudo obtener URL de adjunto para tarjeta {card_id} o no existe. Omitiendo procesamiento del adjunto.")
-        return {"status": "success", "message": f"Webhook recibido para tarjeta {card_id}, pero no se procesó adjunto."}
-
-    downloaded_file_path = await download_file(attachment_url, card_id)
-
-    if not downloaded_file_path:
-        logger.error(f"Fallo al descargar adjunto desde {attachment_url} para tarjeta {card_id}. Abortando.")
-        raise HTTPException(status_code=500, detail="Error al descargar archivo adjunto de Pipefy.")
-
+    # Verificar duplicación una vez autenticado: el registro del webhook queda en
+    # 'processing' y solo pasa a 'done' cuando process_card termina bien
+    webhook_id = None
     try:
-        # Verificar caché
-        is_cached, cached_result_path = is_cached_document(downloaded_file_path)
+        webhook_id = generate_webhook_id(payload)
         
-        if is_cached and cached_result_path and os.path.exists(cached_result_path):
-            logger.info(f"Usando resultado en caché para tarjeta {card_id}: {cached_result_path}")
-            
-            # Copiar resultado cacheado a un nuevo archivo específico para esta tarjeta
-            md_filename = os.path.join(OUTPUT_DIR, f"{card_id}_extracted.md")
-            with open(cached_result_path, 'r', encoding='utf-8') as src:
-                with open(md_filename, 'w', encoding='utf-8') as dst:
-                    dst.write(src.read())
+        if is_duplicate_webhook(webhook_id, card_id):
+            logger.info("Omitiendo procesamiento de webhook duplicado para tarjeta %s", card_id)
+            return {"status": "success", "message": f"Webhook duplicado para tarjeta {card_id}, ignorado", "duplicate": True}
             
-            logger.info(f"Resultado cacheado copiado para tarjeta {card_id} en {md_filename}")
-            return {"status": "success", "message": f"Adjunto procesado desde caché para tarjeta {card_id}", "cached": True}
-        
-        # Si no está en caché, procesar normalmente
-        logger.info(f"Iniciando procesamiento con agentic-doc para archivo: {downloaded_file_path}")
-        
-        if not VISION_AGENT_API_KEY:
-            logger.warning("Variable de entorno VISION_AGENT_API_KEY no configurada. agentic-doc podría fallar o tener funcionalidad limitada.")
-
-        results = parse_documents([downloaded_file_path])
-
-        if not results or len(results) == 0:
-            logger.error(f"agentic-doc no retornó resultados para {downloaded_file_path}")
-            raise HTTPException(status_code=500, detail="El procesamiento con agentic-doc no produjo resultados.")
-
-        parsed_doc = results[0]
-        logger.info(f"Documento procesado exitosamente para tarjeta {card_id} con agentic-doc.")
-
-        # Guardar resultados y añadir a caché
-        md_filename = save_results(card_id, parsed_doc.markdown, parsed_doc.chunks)
-        if md_filename:
-            add_to_cache(downloaded_file_path, md_filename)
-
     except Exception as e:
-        logger.error(f"Error durante el procesamiento con agentic-doc o guardando resultados para {downloaded_file_path}: {e}", exc_info=True)
-        if downloaded_file_path and os.path.exists(downloaded_file_path):
-            try:
-                os.remove(downloaded_file_path)
-                logger.info(f"Archivo temporal limpiado tras error: {downloaded_file_path}")
-            except OSError as rm_err:
-                logger.error(f"Error eliminando archivo temporal {downloaded_file_path} tras error: {rm_err}")
-        raise HTTPException(status_code=500, detail=f"Error procesando documento: {e}")
-
-    finally:
-        if downloaded_file_path and os.path.exists(downloaded_file_path):
-            try:
-                os.remove(downloaded_file_path)
-                logger.info(f"Archivo temporal limpiado al final: {downloaded_file_path}")
-            except OSError as e:
-                logger.error(f"Error eliminando archivo temporal {downloaded_file_path} al final: {e}")
+        logger.error("Error verificando duplicación del webhook: %s", e)
+        # Continuamos con el procesamiento normal en caso de error
 
-    logger.info(f"Procesamiento completado exitosamente para tarjeta {card_id}")
-    return {"status": "success", "message": f"Adjunto procesado exitosamente para tarjeta {card_id}"}
+    background_tasks.add_task(process_card, card_id, webhook_id)
+    logger.info("Procesamiento de tarjeta %s encolado en segundo plano.", card_id)
+    return ORJSONResponse(
+        status_code=202,
+        content={"status": "accepted", "message": f"Webhook aceptado para tarjeta {card_id}, el adjunto se procesará en segundo plano."}
+    )
 
 @app.get("/health")
 async def health_check():
-    """Endpoint básico de verificación de salud."""
-    return {"status": "ok"}
+    """Endpoint básico de verificación de salud, con los contadores de deduplicación."""
+    with cache_lock:
+        return {"status": "ok", **WEBHOOK_METRICS}
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -540,71 +1080,71 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     Manejador personalizado para errores de validación de Pydantic.
     Proporciona un mensaje de error más amigable con detalles específicos.
     """
-    logger.error(f"Error de validación: {exc}")
-    
-    # Formatea los errores
-    errors = []
-    for error in exc.errors():
-        error_loc = " -> ".join([str(loc) for loc in error["loc"]])
-        error_msg = error["msg"]
-        error_type = error.get("type", "unknown_error")
-        errors.append(f"Ubicación: {error_loc}, Error: {error_msg}, Tipo: {error_type}")
-    
-    error_detail = "\n".join(errors)
-    logger.error(f"Detalles del error de validación:\n{error_detail}")
+    errors = exc.errors()
+    logger.error(
+        "Error de validación. Detalles:\n%s",
+        "\n".join(
+            f"Ubicación: {' -> '.join(map(str, error['loc']))}, Error: {error['msg']}, Tipo: {error.get('type', 'unknown_error')}"
+            for error in errors
+        ),
+    )
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=422,
         content={
             "detail": "Error al procesar la solicitud del webhook. Por favor, verifique el formato de los datos.",
-            "errors": exc.errors(),
+            "errors": jsonable_encoder(errors),
             "suggestion": "Asegúrese de que todos los campos del webhook tienen el formato correcto."
         },
     )
 
+def list_dir_files(directory: str) -> List[Dict[str, Any]]:
+    """
+    Lista los archivos de un directorio con tamaño y fecha de modificación, sin los
+    temporales (*.tmp) que aún se están escribiendo o descargando.
+    os.scandir evita un stat por llamada (isfile, getsize, getmtime): is_file() usa
+    el tipo que ya devuelve el directorio y stat() se hace una vez por entrada.
+    """
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                files.append({
+                    "nombre": entry.name,
+                    "tamaño": st.st_size,
+                    "modificado": st.st_mtime,
+                    "ruta": entry.path
+                })
+    return files
+
 @app.get("/archivos")
 async def list_files():
     """Endpoint para listar los archivos disponibles en el directorio de salida."""
     try:
-        if not os.path.exists(OUTPUT_DIR):
-            logger.warning(f"El directorio {OUTPUT_DIR} no existe")
+        try:
+            files = await asyncio.to_thread(list_dir_files, OUTPUT_DIR)
+        except FileNotFoundError:
+            logger.warning("El directorio %s no existe", OUTPUT_DIR)
             return {"status": "error", "message": f"El directorio {OUTPUT_DIR} no existe"}
-            
-        files = []
-        for filename in os.listdir(OUTPUT_DIR):
-            filepath = os.path.join(OUTPUT_DIR, filename)
-            if os.path.isfile(filepath):
-                file_info = {
-                    "nombre": filename,
-                    "tamaño": os.path.getsize(filepath),
-                    "modificado": os.path.getmtime(filepath),
-                    "ruta": filepath
-                }
-                files.append(file_info)
                 
-        # Verifica también el directorio raíz /data por si acaso
+        # Verifica también el directorio raíz /data por si acaso (si no es el propio OUTPUT_DIR)
         data_files = []
-        if os.path.exists("/data") and OUTPUT_DIR != "/data":
-            for filename in os.listdir("/data"):
-                filepath = os.path.join("/data", filename)
-                if os.path.isfile(filepath):
-                    file_info = {
-                        "nombre": filename,
-                        "tamaño": os.path.getsize(filepath),
-                        "modificado": os.path.getmtime(filepath),
-                        "ruta": filepath
-                    }
-                    data_files.append(file_info)
+        if OUTPUT_DIR != "/data":
+            try:
+                data_files = await asyncio.to_thread(list_dir_files, "/data")
+            except FileNotFoundError:
+                pass
                     
         return {
             "status": "success", 
             "archivos": files,
-            "archivos_data": data_files if OUTPUT_DIR != "/data" else [],
+            "archivos_data": data_files,
             "directorio": OUTPUT_DIR,
             "disco_persistente": "/data"
         }
     except Exception as e:
-        logger.error(f"Error listando archivos: {e}", exc_info=True)
+        logger.error("Error listando archivos: %s", e, exc_info=True)
         return {"status": "error", "message": f"Error listando archivos: {str(e)}"}
 
 @app.get("/archivo/{card_id}")
@@ -614,18 +1154,19 @@ async def get_file_content(card_id: str):
         filename = f"{card_id}_extracted.md"
         filepath = os.path.join(OUTPUT_DIR, filename)
         
-        if not os.path.exists(filepath):
-            logger.warning(f"Archivo no encontrado: {filepath}")
+        try:
+            async with aiofiles.open(filepath, "r", encoding="utf-8") as f:
+                content = await f.read()
+        except FileNotFoundError:
+            logger.warning("Archivo no encontrado: %s", filepath)
             # Buscar en directorio raíz como plan B
-            alt_filepath = os.path.join("/data", filename)
-            if os.path.exists(alt_filepath):
-                filepath = alt_filepath
-                logger.info(f"Archivo encontrado en ruta alternativa: {filepath}")
-            else:
+            filepath = os.path.join("/data", filename)
+            try:
+                async with aiofiles.open(filepath, "r", encoding="utf-8") as f:
+                    content = await f.read()
+            except FileNotFoundError:
                 return {"status": "error", "message": "Archivo no encontrado"}
-                
-        with open(filepath, "r", encoding="utf-8") as f:
-            content = f.read()
+            logger.info("Archivo encontrado en ruta alternativa: %s", filepath)
             
         return {
             "status": "success",
@@ -635,5 +1176,5 @@ async def get_file_content(card_id: str):
             "filepath": filepath
         }
     except Exception as e:
-        logger.error(f"Error leyendo archivo para tarjeta {card_id}: {e}", exc_info=True)
+        logger.error("Error leyendo archivo para tarjeta %s: %s", card_id, e, exc_info=True)
         return {"status": "error", "message": f"Error leyendo archivo: {str(e)}"} 
\ No newline at end of file